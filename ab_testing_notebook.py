@@ -364,7 +364,7 @@ def check_sample_ratio_mismatch(df, expected_ratio=0.5, alpha=0.001):
     # Chi-square test
     chi2_stat = ((control_count - expected_control)**2 / expected_control + 
                  (treatment_count - expected_treatment)**2 / expected_treatment)
-    p_value = 1 - stats.chi2.cdf(chi2_stat, df=1)
+    p_value = stats.chi2.sf(chi2_stat, df=1)
     
     print(f"🔍 Sample Ratio Mismatch Check:")
     print(f"   Control: {control_count:,} ({control_count/total:.1%})")
@@ -467,7 +467,7 @@ def analyze_conversion_rate(df):
     observed_effect = absolute_lift
     pooled_p = (control_conv + treatment_conv) / (control_sessions + treatment_sessions)
     pooled_se = np.sqrt(2 * pooled_p * (1 - pooled_p) / min(control_sessions, treatment_sessions))
-    observed_power = 1 - stats.norm.cdf(1.96 - observed_effect / pooled_se)
+    observed_power = stats.norm.sf(1.96 - observed_effect / pooled_se)
     
     print(f"📊 Statistical Test Results:")
     print(f"   Control conversion rate:    {control_rate:.3%}")
@@ -1,8 +1,101 @@
 
+import sys
+from functools import lru_cache
 import numpy as np
-from scipy import stats
+from scipy.special import ndtr, ndtri
 import pandas as pd
-from statsmodels.stats.proportion import proportions_ztest, proportion_confint
+
+# Standard normal critical values for the default alpha=0.05 (two-sided) and power=0.8
+_Z975 = 1.959963984540054
+_Z_POWER_08 = 0.8416212335729143
+
+@lru_cache(maxsize=128)
+def _critical_values(alpha, power):
+    """Two-sided z_alpha and z_beta for a given (alpha, power), cached across calls"""
+    z_alpha = _Z975 if alpha == 0.05 else float(ndtri(1 - alpha/2))
+    z_beta = _Z_POWER_08 if power == 0.8 else float(ndtri(power))
+    return z_alpha, z_beta
+
+# Fixed category order so variant codes are always 0 = control, 1 = treatment (-1 = other)
+_VARIANT_DTYPE = pd.CategoricalDtype(['control', 'treatment'])
+
+def _prepare(df, columns=('variant', 'converted', 'order_value')):
+    """
+    Shrink the columns the analyses stream over: variant becomes a categorical with fixed
+    int8 codes, converted becomes int8 and order_value float32. Only the given columns are
+    converted, and already prepared columns are left as-is. A missing value in converted
+    raises ValueError, since it cannot be stored as int8; a missing order_value counts as 0
+    revenue, as a skipna sum would.
+
+    float32 rounds each order value to within 6e-8 of itself (relative). Revenue totals are
+    summed in float64, which adds negligible error but does not undo that per-row rounding,
+    so the error of a total grows with row count and order size: about $0.01 over 1M orders
+    of $10-$300, about $0.60 over 1M orders of $50k-$100k.
+    """
+    updates = {}
+    variant_dtype = df['variant'].dtype
+    # Unordered categorical equality ignores category order, so compare the categories
+    # themselves; the codes are only 0 = control, 1 = treatment in this exact order
+    if 'variant' in columns and not (isinstance(variant_dtype, pd.CategoricalDtype) and
+            list(variant_dtype.categories) == list(_VARIANT_DTYPE.categories)):
+        # Map values to codes by label so any other variant or NaN becomes -1
+        codes = _VARIANT_DTYPE.categories.get_indexer(df['variant'])
+        updates['variant'] = pd.Categorical.from_codes(codes, dtype=_VARIANT_DTYPE)
+
+    dtypes = {'converted': np.int8, 'order_value': np.float32}
+    to_convert = [col for col in columns if col in dtypes and df[col].dtype != dtypes[col]]
+    if 'converted' in to_convert and df['converted'].isna().any():
+        raise ValueError("converted contains missing values; drop or fill them before analysis")
+    updates.update({col: df[col].astype(dtypes[col]) for col in to_convert})
+    # Revenue is summed with weighted bincounts, which would propagate NaN
+    if 'order_value' in columns:
+        order_value = updates.get('order_value', df['order_value'])
+        if order_value.isna().any():
+            updates['order_value'] = order_value.fillna(0)
+    return df.assign(**updates) if updates else df
+
+def _variant_codes(df):
+    """Variant codes of a prepared frame: 0 = control, 1 = treatment, -1 = other"""
+    return df['variant'].cat.codes.to_numpy()
+
+def _wilson_ci(conversions, sessions, z=_Z975):
+    """
+    Wilson score interval for binomial proportions, vectorized over arrays of counts
+
+    Returns:
+    --------
+    tuple : (lower bounds, upper bounds), defaulting to 95% intervals
+    """
+    conversions = np.asarray(conversions, dtype=np.float64)
+    sessions = np.asarray(sessions, dtype=np.float64)
+
+    p = conversions / sessions
+    denominator = 1 + z * z / sessions
+    center = p + z * z / (2 * sessions)
+    half_width = z * np.sqrt(p * (1 - p) / sessions + z * z / (4 * sessions * sessions))
+    return (center - half_width) / denominator, (center + half_width) / denominator
+
+def _two_proportion_ztest(control_conv, control_sessions, treatment_conv, treatment_sessions):
+    """
+    Pooled two-proportion z-test (treatment vs control), vectorized over arrays of counts
+
+    Returns:
+    --------
+    tuple : (z-statistic, two-sided p-value), with the shape of the inputs
+    """
+    control_conv = np.asarray(control_conv, dtype=np.float64)
+    control_sessions = np.asarray(control_sessions, dtype=np.float64)
+    treatment_conv = np.asarray(treatment_conv, dtype=np.float64)
+    treatment_sessions = np.asarray(treatment_sessions, dtype=np.float64)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pooled_p = (control_conv + treatment_conv) / (control_sessions + treatment_sessions)
+        pooled_se = np.sqrt(pooled_p * (1 - pooled_p) *
+                            (1 / control_sessions + 1 / treatment_sessions))
+        z_stat = (treatment_conv / treatment_sessions - control_conv / control_sessions) / pooled_se
+    p_value = 2 * ndtr(-np.abs(z_stat))
+    return z_stat, p_value
+
 
 def calculate_sample_size(baseline_rate, minimum_effect, alpha=0.05, power=0.8):
     """
@@ -10,15 +103,24 @@ def calculate_sample_size(baseline_rate, minimum_effect, alpha=0.05, power=0.8):
     
     Parameters:
     -----------
-    baseline_rate: float, Current conversion rate (control group expected rate)
-    minimum_effect: float, Minimum detectable effect (absolute difference)
+    baseline_rate: float or array-like, Current conversion rate (control group expected rate)
+    minimum_effect: float or array-like, Minimum detectable effect (absolute difference)
     alpha: float, Significance level (Type I error rate)
     power: float, Statistical power (1 - Type II error rate)
     
     Returns:
     --------
-    int : Required sample size per group
+    int or np.ndarray : Required sample size per group, broadcast over array inputs
+
+    Raises:
+    -------
+    ValueError : If any minimum_effect is zero or any rate gives no finite sample size
     """
+    baseline_rate = np.asarray(baseline_rate, dtype=np.float64)
+    minimum_effect = np.asarray(minimum_effect, dtype=np.float64)
+    if np.any(minimum_effect == 0):
+        raise ValueError("minimum_effect must be non-zero")
+
     # Calculate effect size
     p1 = baseline_rate
     p2 = baseline_rate + minimum_effect
@@ -32,17 +134,21 @@ def calculate_sample_size(baseline_rate, minimum_effect, alpha=0.05, power=0.8):
     # SE = sqrt(2 * p_pooled * (1 - p_pooled) / n) = se_coefficient / sqrt(n)
 
     # Standard error coefficient
-    se_coefficient = np.sqrt(2 * p_pooled * (1 - p_pooled))
+    with np.errstate(invalid='ignore'):
+        se_coefficient = np.sqrt(2 * p_pooled * (1 - p_pooled))
     
-    # Critical values
-    z_alpha = stats.norm.ppf(1 - alpha/2)  # Two-tailed test
-    z_beta = stats.norm.ppf(power)
+    # Critical values (scalars, shared by every element; two-tailed test)
+    z_alpha, z_beta = _critical_values(alpha, power)
     
     # Sample size calculation
-    n = ((z_alpha + z_beta) * se_coefficient / minimum_effect) ** 2
-    return int(np.ceil(n))
+    n = np.ceil(((z_alpha + z_beta) * se_coefficient / minimum_effect) ** 2)
+    if not np.all(np.isfinite(n)):
+        raise ValueError("sample size is not finite; baseline_rate and minimum_effect "
+                         "must give rates within [0, 1]")
+    n = n.astype(np.int64)
+    return int(n) if n.ndim == 0 else n
 
-def check_sample_ratio_mismatch(df, expected_ratio=0.5, alpha=0.001):
+def check_sample_ratio_mismatch(df, expected_ratio=0.5, alpha=0.001, verbose=True):
     """
     Test for Sample Ratio Mismatch using Chi-square test
     
@@ -51,10 +157,14 @@ def check_sample_ratio_mismatch(df, expected_ratio=0.5, alpha=0.001):
     df : pd.DataFrame, Experiment data
     expected_ratio : float, Expected proportion for each group (0.5 for 50/50 split)
     alpha : float, Significance level for SRM test (typically 0.001)
+    verbose : bool, Print the check report (disable in sweeps and simulations)
     """
-    variant_counts = df['variant'].value_counts()
-    control_count = variant_counts.get('control', 0)
-    treatment_count = variant_counts.get('treatment', 0)
+    df = _prepare(df, columns=('variant',))
+
+    # Shift codes by one so that unknown variants (-1) land in bin 0
+    variant_counts = np.bincount(_variant_codes(df) + 1, minlength=3)
+    control_count = variant_counts[1]
+    treatment_count = variant_counts[2]
     total = control_count + treatment_count
     
     expected_control = total * expected_ratio
@@ -63,58 +173,69 @@ def check_sample_ratio_mismatch(df, expected_ratio=0.5, alpha=0.001):
     # Chi-square test
     chi2_stat = ((control_count - expected_control)**2 / expected_control + 
                  (treatment_count - expected_treatment)**2 / expected_treatment)
-    p_value = 1 - stats.chi2.cdf(chi2_stat, df=1)
+    # With one degree of freedom chi-square is a squared standard normal,
+    # so the upper tail is the two-sided normal tail at sqrt(chi2)
+    p_value = 2 * ndtr(-np.sqrt(chi2_stat))
     
-    print(f"   Sample Ratio Mismatch Check:")
-    print(f"   Control: {control_count:,} ({control_count/total:.1%})")
-    print(f"   Treatment: {treatment_count:,} ({treatment_count/total:.1%})")
-    print(f"   Expected split: {expected_ratio:.1%} / {1-expected_ratio:.1%}")
-    print(f"   Chi-square statistic: {chi2_stat:.4f}")
-    print(f"   P-value: {p_value:.6f}")
-    print(f"   Result: {'PASS' if p_value > alpha else 'FAIL - INVESTIGATE'}")
+    if verbose:
+        lines = [
+            f"   Sample Ratio Mismatch Check:",
+            f"   Control: {control_count:,} ({control_count/total:.1%})",
+            f"   Treatment: {treatment_count:,} ({treatment_count/total:.1%})",
+            f"   Expected split: {expected_ratio:.1%} / {1-expected_ratio:.1%}",
+            f"   Chi-square statistic: {chi2_stat:.4f}",
+            f"   P-value: {p_value:.6f}",
+            f"   Result: {'PASS' if p_value > alpha else 'FAIL - INVESTIGATE'}",
+        ]
+        sys.stdout.write("\n".join(lines) + "\n")
 
     return p_value > alpha
 
 
-def analyze_conversion_rate(df):
+def analyze_conversion_rate(df, verbose=True):
     """
     Comprehensive conversion rate analysis with statistical tests
+
+    Parameters:
+    -----------
+    df : pd.DataFrame, Experiment data
+    verbose : bool, Print the analysis report (disable in sweeps and simulations)
     """
     
-    # Calculate conversion metrics by variant
-    conversion_summary = df.groupby('variant').agg({
-        'converted': ['count', 'sum', 'mean'],
-        'order_value': 'sum'
-    }).round(4)
-    
-    # Flatten column names
-    conversion_summary.columns = ['sessions', 'conversions', 'conversion_rate', 'total_revenue']
-    conversion_summary['revenue_per_user'] = (
-        conversion_summary['total_revenue'] / conversion_summary['sessions']
-    )
-    
-    print("PRIMARY METRIC: CONVERSION RATE")
-    print("=" * 50)
-    print()
+    df = _prepare(df)
+
+    # Calculate conversion metrics by variant; codes are shifted by one so that unknown
+    # variants (-1) land in bin 0 and are dropped, leaving 0 = control, 1 = treatment.
+    # The conversion rate and revenue per user follow from the three sums
+    bins = _variant_codes(df).astype(np.intp) + 1
+    sessions = np.bincount(bins, minlength=3)[1:].astype(np.float64)
+    conversions = np.bincount(bins, weights=df['converted'].to_numpy(), minlength=3)[1:]
+    total_revenue = np.bincount(bins, weights=df['order_value'].to_numpy(), minlength=3)[1:]
+    conversion_rate = conversions / sessions
+    revenue_per_user = total_revenue / sessions
+
+    conversion_summary = pd.DataFrame({
+        'sessions': sessions.astype(np.int64),
+        'conversions': conversions.astype(np.int64),
+        'conversion_rate': conversion_rate.round(4),
+        'total_revenue': total_revenue.round(4),
+        'revenue_per_user': revenue_per_user
+    }, index=pd.Index(['control', 'treatment'], name='variant'))
     
     # Extract values for statistical testing
-    control_conv = conversion_summary.loc['control', 'conversions']
-    control_sessions = conversion_summary.loc['control', 'sessions']
-    treatment_conv = conversion_summary.loc['treatment', 'conversions']
-    treatment_sessions = conversion_summary.loc['treatment', 'sessions']
-    
-    control_rate = control_conv / control_sessions
-    treatment_rate = treatment_conv / treatment_sessions
+    control_sessions, treatment_sessions = sessions
+    control_conv, treatment_conv = conversions
+    control_rate, treatment_rate = conversion_rate
+    control_rpu, treatment_rpu = revenue_per_user
 
     # Two-proportion z-test
-    z_stat, p_value = proportions_ztest(
-        [treatment_conv, control_conv], 
-        [treatment_sessions, control_sessions]
-    )
+    z_stat, p_value = _two_proportion_ztest(control_conv, control_sessions,
+                                            treatment_conv, treatment_sessions)
     
-    # Confidence intervals (95%)
-    control_ci = proportion_confint(control_conv, control_sessions, alpha=0.05)
-    treatment_ci = proportion_confint(treatment_conv, treatment_sessions, alpha=0.05)
+    # Confidence intervals (95%, Wilson score) for control and treatment together
+    ci_lower, ci_upper = _wilson_ci(conversions, sessions)
+    control_ci = (ci_lower[0], ci_upper[0])
+    treatment_ci = (ci_lower[1], ci_upper[1])
     
     # Effect size calculations (maginitude of difference)
     absolute_lift = treatment_rate - control_rate
@@ -126,8 +247,8 @@ def analyze_conversion_rate(df):
         (control_rate * (1 - control_rate) / control_sessions)
     )
     absolute_lift_ci = (
-        absolute_lift - 1.96 * absolute_lift_se,
-        absolute_lift + 1.96 * absolute_lift_se
+        absolute_lift - _Z975 * absolute_lift_se,
+        absolute_lift + _Z975 * absolute_lift_se
     )
     # Note: The absolute lift CI calculation is a simplified approach.
     # For more accurate CI, you can use bootstrapping or other methods.
@@ -136,36 +257,40 @@ def analyze_conversion_rate(df):
     observed_effect = absolute_lift
     pooled_p = (control_conv + treatment_conv) / (control_sessions + treatment_sessions)
     pooled_se = np.sqrt(2 * pooled_p * (1 - pooled_p) / min(control_sessions, treatment_sessions))
-    observed_power = 1 - stats.norm.cdf(1.96 - observed_effect / pooled_se)
-    
-    print(f" Statistical Test Results:")
-    print(f"   Control conversion rate:    {control_rate:.3%}")
-    print(f"   Treatment conversion rate:  {treatment_rate:.3%}")
-    print(f"   95% CI Control:             [{control_ci[0]:.3%}, {control_ci[1]:.3%}]")
-    print(f"   95% CI Treatment:           [{treatment_ci[0]:.3%}, {treatment_ci[1]:.3%}]")
-    print()
-    print(f" Effect Size:")
-    print(f"   Absolute lift:              +{absolute_lift:.3%}")
-    print(f"   Relative lift:              +{relative_lift:.1f}%")
-    print(f"   Absolute lift CI:           {absolute_lift_ci[0]:.3%} to {absolute_lift_ci[1]:.3%}")
-    print()
-    print(f"Statistical Significance:")
-    print(f"   Z-statistic:                {z_stat:.4f}")
-    print(f"   P-value:                    {p_value:.6f}")
-    print(f"   Significant (α=0.05):       {' YES' if p_value < 0.05 else '❌ NO'}")
-    print(f"   Observed power:             {observed_power:.1%}")
-    
-    print(" Revenue Per User:")
-    print(f"   Control:                    ${conversion_summary.loc['control', 'revenue_per_user']:.2f}")
-    print(f"   Treatment:                  ${conversion_summary.loc['treatment', 'revenue_per_user']:.2f}")
-    print(f"   Revenue lift:               {(conversion_summary.loc['treatment', 'revenue_per_user'] / conversion_summary.loc['control', 'revenue_per_user']-1)*100:.2f}%")
-
-
+    observed_power = ndtr(observed_effect / pooled_se - _Z975)
+    
+    if verbose:
+        lines = [
+            "PRIMARY METRIC: CONVERSION RATE",
+            "=" * 50,
+            "",
+            f" Statistical Test Results:",
+            f"   Control conversion rate:    {control_rate:.3%}",
+            f"   Treatment conversion rate:  {treatment_rate:.3%}",
+            f"   95% CI Control:             [{control_ci[0]:.3%}, {control_ci[1]:.3%}]",
+            f"   95% CI Treatment:           [{treatment_ci[0]:.3%}, {treatment_ci[1]:.3%}]",
+            "",
+            f" Effect Size:",
+            f"   Absolute lift:              +{absolute_lift:.3%}",
+            f"   Relative lift:              +{relative_lift:.1f}%",
+            f"   Absolute lift CI:           {absolute_lift_ci[0]:.3%} to {absolute_lift_ci[1]:.3%}",
+            "",
+            f"Statistical Significance:",
+            f"   Z-statistic:                {z_stat:.4f}",
+            f"   P-value:                    {p_value:.6f}",
+            f"   Significant (α=0.05):       {' YES' if p_value < 0.05 else '❌ NO'}",
+            f"   Observed power:             {observed_power:.1%}",
+            " Revenue Per User:",
+            f"   Control:                    ${control_rpu:.2f}",
+            f"   Treatment:                  ${treatment_rpu:.2f}",
+            f"   Revenue lift:               {(treatment_rpu / control_rpu - 1)*100:.2f}%",
+        ]
+        sys.stdout.write("\n".join(lines) + "\n")
 
     return conversion_summary, p_value, absolute_lift, relative_lift
 
 
-def segmentation_analysis(df, segment_col, min_sample_size=100):
+def segmentation_analysis(df, segment_col, min_sample_size=100, verbose=True):
     """
     Analyze treatment effect across different user segments
     
@@ -177,60 +302,70 @@ def segmentation_analysis(df, segment_col, min_sample_size=100):
         Column name for segmentation
     min_sample_size : int
         Minimum sample size per segment for statistical testing
+    verbose : bool
+        Print the per-segment report (disable in sweeps and simulations)
     """
     
-    print(f" SEGMENTATION ANALYSIS: {segment_col.upper()}")
-    print("=" * 60)
-    
-    segments = df[segment_col].unique()
-    segment_results = []
-    
-    for segment in segments:
-        segment_data = df[df[segment_col] == segment]
-        
-        # Split by variant
-        control_segment = segment_data[segment_data['variant'] == 'control']
-        treatment_segment = segment_data[segment_data['variant'] == 'treatment']
-        
-        # Calculate metrics
-        control_conversions = control_segment['converted'].sum()
-        control_sessions = len(control_segment)
-        treatment_conversions = treatment_segment['converted'].sum()
-        treatment_sessions = len(treatment_segment)
-        
-        if (control_sessions >= min_sample_size and treatment_sessions >= min_sample_size and
-            control_conversions >= 5 and treatment_conversions >= 5):
-            
-            control_rate = control_conversions / control_sessions
-            treatment_rate = treatment_conversions / treatment_sessions
-            
-            # Statistical test
-            z_stat, p_value = proportions_ztest(
-                [treatment_conversions, control_conversions], 
-                [treatment_sessions, control_sessions]
-            )
-            
-            absolute_lift = treatment_rate - control_rate
-            relative_lift = (treatment_rate / control_rate - 1) * 100 if control_rate > 0 else 0
-            
-            segment_results.append({
-                'segment': segment,
-                'control_sessions': control_sessions,
-                'treatment_sessions': treatment_sessions,
-                'control_rate': control_rate,
-                'treatment_rate': treatment_rate,
-                'absolute_lift': absolute_lift,
-                'relative_lift': relative_lift,
-                'p_value': p_value,
-                'significant': p_value < 0.05
-            })
-            
-            significance = ' SIG' if p_value < 0.05 else ' NS'
-            print(f"{segment:12} | Control: {control_rate:.1%} | Treatment: {treatment_rate:.1%} | "
-                  f"Lift: {relative_lift:+.1f}% | p={p_value:.3f} | {significance}")
-        else:
-            print(f"{segment:12} | Insufficient sample size for reliable testing")
-    
-    print()
-    return pd.DataFrame(segment_results)
+    df = _prepare(df, columns=('variant',))
+
+    # Per-segment conversions and sessions for both variants via weighted bincounts
+    segment_codes, segments = pd.factorize(df[segment_col], use_na_sentinel=False)
+    n_segments = len(segments)
+    variant_codes = _variant_codes(df)
+    is_control = (variant_codes == 0).astype(np.float64)
+    is_treatment = (variant_codes == 1).astype(np.float64)
+    # Read converted once as the float64 bincount weight; missing values count as 0,
+    # as a skipna sum would
+    converted = df['converted'].to_numpy(dtype=np.float64, na_value=0)
+
+    control_sessions = np.bincount(segment_codes, weights=is_control, minlength=n_segments)
+    treatment_sessions = np.bincount(segment_codes, weights=is_treatment, minlength=n_segments)
+    control_conversions = np.bincount(segment_codes, weights=converted * is_control,
+                                      minlength=n_segments)
+    treatment_conversions = np.bincount(segment_codes, weights=converted * is_treatment,
+                                        minlength=n_segments)
+    control_sessions = control_sessions.astype(np.int64)
+    treatment_sessions = treatment_sessions.astype(np.int64)
+
+    valid = ((control_sessions >= min_sample_size) & (treatment_sessions >= min_sample_size) &
+             (control_conversions >= 5) & (treatment_conversions >= 5))
+
+    # Only testable segments get rates, lifts and a test; the rest stay NaN.
+    # Valid segments have at least 5 conversions per variant, so every rate is positive.
+    control_rate = np.full(n_segments, np.nan)
+    treatment_rate = np.full(n_segments, np.nan)
+    p_value = np.full(n_segments, np.nan)
+    control_rate[valid] = control_conversions[valid] / control_sessions[valid]
+    treatment_rate[valid] = treatment_conversions[valid] / treatment_sessions[valid]
+    absolute_lift = treatment_rate - control_rate
+    relative_lift = (treatment_rate / control_rate - 1) * 100
+
+    # Statistical test
+    _, p_value[valid] = _two_proportion_ztest(control_conversions[valid], control_sessions[valid],
+                                              treatment_conversions[valid], treatment_sessions[valid])
+
+    significant = p_value < 0.05
+
+    if verbose:
+        lines = [f" SEGMENTATION ANALYSIS: {segment_col.upper()}", "=" * 60]
+        for i, segment in enumerate(segments):
+            if valid[i]:
+                significance = ' SIG' if significant[i] else ' NS'
+                lines.append(f"{segment:12} | Control: {control_rate[i]:.1%} | Treatment: {treatment_rate[i]:.1%} | "
+                             f"Lift: {relative_lift[i]:+.1f}% | p={p_value[i]:.3f} | {significance}")
+            else:
+                lines.append(f"{segment:12} | Insufficient sample size for reliable testing")
+        sys.stdout.write("\n".join(lines) + "\n\n")
 
+    # Build the result for testable segments directly from the column arrays
+    return pd.DataFrame({
+        'segment': np.asarray(segments)[valid],
+        'control_sessions': control_sessions[valid],
+        'treatment_sessions': treatment_sessions[valid],
+        'control_rate': control_rate[valid],
+        'treatment_rate': treatment_rate[valid],
+        'absolute_lift': absolute_lift[valid],
+        'relative_lift': relative_lift[valid],
+        'p_value': p_value[valid],
+        'significant': significant[valid]
+    })